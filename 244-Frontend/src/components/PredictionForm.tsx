@@ -154,7 +154,7 @@ const PredictionForm: React.FC = () => {
     setIsSubmitted(true);
     
     try {
-      const response = await fetch("http://127.0.0.1:49232/predict", {
+      const response = await fetch("http://127.0.0.1:49232/predict?proba=true", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -172,7 +172,9 @@ const PredictionForm: React.FC = () => {
         const savedPrediction = await savePrediction(
           user.id,
           formData,
-          predictionResult
+          predictionResult,
+          data.isHighRisk,
+          data.probability ?? null
         );
 
         if (savedPrediction) {
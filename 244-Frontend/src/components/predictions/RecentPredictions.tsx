@@ -18,7 +18,7 @@ const RecentPredictions: React.FC<RecentPredictionsProps> = ({ predictions }) =>
           >
             <div className="flex items-center gap-4">
               <div className={`p-2 rounded-full ${
-                prediction.prediction_result.includes('Low')
+                !prediction.is_high_risk
                   ? 'bg-green-100 text-green-600'
                   : 'bg-red-100 text-red-600'
               }`}>
@@ -34,11 +34,11 @@ const RecentPredictions: React.FC<RecentPredictionsProps> = ({ predictions }) =>
               </div>
             </div>
             <div className={`px-3 py-1 text-sm rounded-full ${
-              prediction.prediction_result.includes('Low')
+              !prediction.is_high_risk
                 ? 'bg-green-100 text-green-800'
                 : 'bg-red-100 text-red-800'
             }`}>
-              {prediction.prediction_result.includes('Low') ? 'Low Risk' : 'High Risk'}
+              {!prediction.is_high_risk ? 'Low Risk' : 'High Risk'}
             </div>
           </div>
         ))}
@@ -4,7 +4,9 @@ import type { FormData, PredictionRecord, UserStats, SystemStats } from '../type
 export const savePrediction = async (
   userId: string,
   predictionData: FormData,
-  predictionResult: string
+  predictionResult: string,
+  isHighRisk: boolean,
+  riskScore: number | null = null
 ): Promise<PredictionRecord | null> => {
   const { data, error } = await supabase
     .from('predictions')
@@ -12,6 +14,8 @@ export const savePrediction = async (
       user_id: userId,
       prediction_data: predictionData,
       prediction_result: predictionResult,
+      risk_score: riskScore,
+      is_high_risk: isHighRisk,
       created_at: new Date().toISOString()
     })
     .select()
@@ -28,7 +32,7 @@ export const savePrediction = async (
 export const getUserStats = async (userId: string): Promise<UserStats | null> => {
   const { data: predictions, error } = await supabase
     .from('predictions')
-    .select('prediction_result, created_at')
+    .select('is_high_risk, created_at')
     .eq('user_id', userId);
 
   if (error) {
@@ -38,8 +42,8 @@ export const getUserStats = async (userId: string): Promise<UserStats | null> =>
 
   return {
     total_predictions: predictions.length,
-    high_risk_predictions: predictions.filter(p => p.prediction_result.includes('High')).length,
-    low_risk_predictions: predictions.filter(p => p.prediction_result.includes('Low')).length,
+    high_risk_predictions: predictions.filter(p => p.is_high_risk).length,
+    low_risk_predictions: predictions.filter(p => p.is_high_risk === false).length,
     last_prediction_date: predictions.length > 0 ? predictions[predictions.length - 1].created_at : null
   };
 };
@@ -75,6 +79,8 @@ export const getRecentActivity = async (limit: number = 5): Promise<PredictionRe
       user_id,
       prediction_data,
       prediction_result,
+      risk_score,
+      is_high_risk,
       created_at,
       users (
         email
@@ -23,6 +23,8 @@ export interface PredictionRecord {
   user_id: string;
   prediction_data: FormData;
   prediction_result: string;
+  risk_score: number | null;
+  is_high_risk: boolean | null;
   created_at: string;
 }
 
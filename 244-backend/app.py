@@ -4,6 +4,9 @@ from flasgger import Swagger, swag_from
 from ecg_service import ecg_bp
 from chatbot_service import chatbot_bp
 
+from explainability import group_ablation_attributions
+from functools import lru_cache
+
 import pickle
 import pandas as pd
 import numpy as np
@@ -45,6 +48,7 @@ label_encoder_path = os.path.join(MODEL_DIR, "label_encoders.pkl")
 one_hot_encoder_path = os.path.join(MODEL_DIR, "one_hot_encoder.pkl")
 scaler_path = os.path.join(MODEL_DIR, "scaler.pkl")
 model_path = os.path.join(MODEL_DIR, "heart_failure_model.pkl")
+calibrator_path = os.path.join(MODEL_DIR, "calibrator.pkl")  # اختياري: مُعاير احتمالات تم تدريبه مسبقًا
 
 # التحقق من وجود الملفات
 if not all(os.path.exists(p) for p in [model_path, label_encoder_path, one_hot_encoder_path, scaler_path]):
@@ -63,6 +67,17 @@ with open(scaler_path, "rb") as scaler_file:
 with open(model_path, "rb") as model_file:
     model = pickle.load(model_file)
 
+# تحميل المُعاير إن وجد (IsotonicRegression أو LogisticRegression على احتمالات النموذج)
+calibrator = None
+if os.path.exists(calibrator_path):
+    with open(calibrator_path, "rb") as calibrator_file:
+        calibrator = pickle.load(calibrator_file)
+
+# حد الخطورة الافتراضي للاحتمال، يمكن تغييره بمتغير البيئة أو لكل طلب
+RISK_THRESHOLD = float(os.environ.get("RISK_THRESHOLD", 0.5))
+HIGH_RISK_RESULT = "High Prediction of heart failure"
+LOW_RISK_RESULT = "Low Prediction of heart failure"
+
 # حفظ أسماء الميزات التي استخدمت أثناء التدريب
 expected_feature_names = list(scaler.feature_names_in_)
 
@@ -84,6 +99,140 @@ valid_options = {
     'SkinCancer': ['Yes', 'No']
 }
 
+# الميزات الفئوية والاسمية المستخدمة أثناء الترميز
+categorical_columns = ['Smoking', 'AlcoholDrinking', 'Stroke', 'DiffWalking', 'Sex',
+                       'PhysicalActivity', 'Asthma', 'KidneyDisease', 'SkinCancer']
+nominal_columns = ['Race', 'Diabetic', 'GenHealth']
+required_columns = list(valid_options.keys()) + ['BMI', 'PhysicalHealth', 'MentalHealth', 'SleepTime']
+
+# إعدادات التفسير: بيانات الخلفية (بعد StandardScaler) وحدود كل طلب
+background_path = os.path.join(MODEL_DIR, "explain_background.npy")
+DEFAULT_BACKGROUND_SIZE = 50
+MAX_BACKGROUND_SIZE = 200
+
+# ربط كل ميزة أصلية بأعمدتها بعد الترميز (أعمدة One-Hot تُجمع تحت الميزة الاسمية)
+one_hot_feature_names = list(one_hot_encoder.get_feature_names_out(nominal_columns))
+feature_groups = {}
+for col in required_columns:
+    if col in nominal_columns:
+        names = [name for name in one_hot_feature_names if name.startswith(f"{col}_")]
+    else:
+        names = [col]
+    feature_groups[col] = [expected_feature_names.index(name) for name in names if name in expected_feature_names]
+feature_groups = {col: idx for col, idx in feature_groups.items() if idx}
+
+def encode_input(data):
+    """
+    تحويل مدخلات المستخدم إلى مصفوفة الميزات المستخدمة أثناء التدريب (بعد StandardScaler)
+
+    العودة:
+    tuple: (المصفوفة بالشكل (N, F)، الأعمدة الناقصة)
+    """
+    user_input = pd.DataFrame(data if isinstance(data, list) else [data])
+
+    # التأكد من أن جميع الأعمدة موجودة
+    missing_columns = [col for col in required_columns if col not in user_input]
+    if missing_columns:
+        return None, missing_columns
+
+    # تحويل الأعمار إلى أرقام
+    age_mapping = {age: i for i, age in enumerate(valid_options['AgeCategory'])}
+    user_input['AgeCategory'] = user_input['AgeCategory'].map(age_mapping)
+
+    # تحويل الميزات الفئوية باستخدام Label Encoder
+    for col in categorical_columns:
+        if col in label_encoders:
+            user_input[col] = label_encoders[col].transform(user_input[col])
+
+    # تحويل الميزات الاسمية باستخدام One-Hot Encoding
+    one_hot_encoded = one_hot_encoder.transform(user_input[nominal_columns])
+    one_hot_df = pd.DataFrame(one_hot_encoded, columns=one_hot_feature_names)
+
+    # دمج البيانات بعد One-Hot Encoding
+    user_input = pd.concat([user_input.drop(nominal_columns, axis=1), one_hot_df], axis=1)
+
+    # إعادة ترتيب الأعمدة بنفس الترتيب المستخدم أثناء التدريب
+    user_input = user_input.reindex(columns=expected_feature_names, fill_value=0)
+
+    # تطبيق StandardScaler
+    return scaler.transform(user_input), []
+
+def positive_class_scores(features):
+    """احتمال الفئة الإيجابية إن كان النموذج يدعم predict_proba، وإلا التنبؤ نفسه"""
+    if hasattr(model, "predict_proba"):
+        return model.predict_proba(features)[:, 1]
+    return np.asarray(model.predict(features), dtype=np.float64)
+
+def risk_scores(features):
+    """
+    احتمال الإصابة بفشل القلب لكل صف، بعد المعايرة إن وُجد مُعاير
+
+    العودة:
+    tuple: (مصفوفة الاحتمالات (N,)، هل تمت المعايرة)
+    """
+    scores = positive_class_scores(features)
+    if calibrator is None:
+        return scores, False
+
+    if hasattr(calibrator, "predict_proba"):
+        scores = calibrator.predict_proba(scores.reshape(-1, 1))[:, 1]
+    else:
+        scores = calibrator.predict(scores)
+    return np.clip(np.asarray(scores, dtype=np.float64), 0.0, 1.0), True
+
+def classify_risk(scores, threshold=RISK_THRESHOLD):
+    """تحويل الاحتمالات إلى نتيجة نصية لجميع الصفوف دفعة واحدة"""
+    return np.where(np.asarray(scores) >= threshold, HIGH_RISK_RESULT, LOW_RISK_RESULT)
+
+def parse_threshold():
+    """
+    قراءة حد الخطورة من الطلب
+
+    العودة:
+    tuple: (الحد، رسالة الخطأ أو None)
+    """
+    threshold = request.args.get('threshold')
+    if threshold is None:
+        return RISK_THRESHOLD, None
+    try:
+        threshold = float(threshold)
+    except ValueError:
+        return None, "threshold must be a number"
+    if not 0.0 <= threshold <= 1.0:
+        return None, "threshold must be between 0 and 1"
+    return threshold, None
+
+def parse_background_size():
+    """
+    قراءة حجم الخلفية من الطلب وتقليصه إلى الحد المسموح
+
+    العودة:
+    tuple: (حجم الخلفية، رسالة الخطأ أو None)
+    """
+    background_size = request.args.get('background_size')
+    if background_size is None:
+        return DEFAULT_BACKGROUND_SIZE, None
+    try:
+        background_size = int(background_size)
+    except ValueError:
+        return None, "background_size must be an integer"
+    return max(1, min(background_size, MAX_BACKGROUND_SIZE)), None
+
+@lru_cache(maxsize=1)
+def get_background():
+    """
+    تحميل بيانات الخلفية مرة واحدة وتخزينها لجميع الطلبات.
+    بدون ملف خلفية نستخدم صفًا واحدًا من الأصفار (متوسط بيانات التدريب بعد StandardScaler).
+    """
+    if os.path.exists(background_path):
+        background = np.load(background_path)
+        # خلط ثابت حتى تكون أي عينة جزئية ممثلة للبيانات
+        background = background[np.random.default_rng(0).permutation(len(background))]
+    else:
+        background = np.zeros((1, len(expected_feature_names)))
+    background.flags.writeable = False
+    return background
+
 @app.route('/')
 @swag_from({
     'responses': {
@@ -128,67 +277,184 @@ def home():
                     'SkinCancer': {'type': 'string', 'enum': ['Yes', 'No']}
                 }
             }
+        },
+        {
+            'name': 'proba',
+            'in': 'query',
+            'type': 'boolean',
+            'required': False,
+            'description': 'Include the (calibrated) probability of heart failure'
+        },
+        {
+            'name': 'threshold',
+            'in': 'query',
+            'type': 'number',
+            'minimum': 0,
+            'maximum': 1,
+            'required': False,
+            'description': f'Probability threshold for a high risk result (default {RISK_THRESHOLD})'
         }
     ],
     'responses': {
         200: {
-            'description': 'Prediction result',
+            'description': 'Prediction result. A list body returns {"predictions": [...]}',
             'schema': {
                 'properties': {
-                    'HeartFailureRisk': {'type': 'string'}
+                    'HeartFailureRisk': {'type': 'string'},
+                    'isHighRisk': {'type': 'boolean'},
+                    'probability': {'type': 'number'},
+                    'threshold': {'type': 'number'},
+                    'calibrated': {'type': 'boolean'}
                 }
             }
         },
         400: {
             'description': 'Invalid input data'
+        },
+        500: {
+            'description': 'Server error'
         }
     }
 })
 def predict():
     try:
         data = request.json
-        user_input = pd.DataFrame([data])
-
-        # التأكد من أن جميع الأعمدة موجودة
-        required_columns = list(valid_options.keys()) + ['BMI', 'PhysicalHealth', 'MentalHealth', 'SleepTime']
-        missing_columns = [col for col in required_columns if col not in user_input]
+        user_input_scaled, missing_columns = encode_input(data)
 
         if missing_columns:
             return jsonify({"error": f"Missing columns: {missing_columns}"}), 400
 
-        # تحويل الأعمار إلى أرقام
-        age_mapping = {age: i for i, age in enumerate(valid_options['AgeCategory'])}
-        user_input['AgeCategory'] = user_input['AgeCategory'].map(age_mapping)
+        # قراءة خيارات الاحتمال وحد الخطورة
+        return_proba = request.args.get('proba', 'false').lower() in ('true', '1', 'yes')
+        threshold, threshold_error = parse_threshold()
+        if threshold_error:
+            return jsonify({"error": threshold_error}), 400
+
+        # تنفيذ التنبؤ لجميع الصفوف دفعة واحدة
+        scores, calibrated = risk_scores(user_input_scaled)
+        results = classify_risk(scores, threshold)
+
+        predictions = []
+        for result, score in zip(results.tolist(), scores.tolist()):
+            prediction = {'HeartFailureRisk': result, 'isHighRisk': result == HIGH_RISK_RESULT}
+            if return_proba:
+                prediction.update({'probability': score, 'threshold': threshold, 'calibrated': calibrated})
+            predictions.append(prediction)
+
+        if isinstance(data, list):
+            return jsonify({'predictions': predictions})
+        return jsonify(predictions[0])
 
-        # تحويل الميزات الفئوية باستخدام Label Encoder
-        categorical_columns = ['Smoking', 'AlcoholDrinking', 'Stroke', 'DiffWalking', 'Sex',
-                               'PhysicalActivity', 'Asthma', 'KidneyDisease', 'SkinCancer']
-        for col in categorical_columns:
-            if col in label_encoders:
-                user_input[col] = label_encoders[col].transform(user_input[col])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/predict/explain', methods=['POST'])
+@swag_from({
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                '$ref': '#/definitions/PredictionInput'
+            }
+        },
+        {
+            'name': 'threshold',
+            'in': 'query',
+            'type': 'number',
+            'minimum': 0,
+            'maximum': 1,
+            'required': False,
+            'description': f'Probability threshold for a high risk result (default {RISK_THRESHOLD})'
+        },
+        {
+            'name': 'background_size',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': f'Number of background samples (max {MAX_BACKGROUND_SIZE})'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Feature attributions for the prediction',
+            'schema': {
+                'properties': {
+                    'HeartFailureRisk': {'type': 'string'},
+                    'isHighRisk': {'type': 'boolean'},
+                    'score': {'type': 'number'},
+                    'threshold': {'type': 'number'},
+                    'calibrated': {'type': 'boolean'},
+                    'expectedScore': {'type': 'number'},
+                    'backgroundSize': {'type': 'integer'},
+                    'attributions': {
+                        'type': 'array',
+                        'description': 'Features ordered by absolute attribution',
+                        'items': {
+                            'properties': {
+                                'feature': {'type': 'string'},
+                                'attribution': {'type': 'number'}
+                            }
+                        }
+                    }
+                }
+            }
+        },
+        400: {
+            'description': 'Invalid input data'
+        },
+        500: {
+            'description': 'Server error'
+        }
+    }
+})
+def explain_prediction():
+    try:
+        data = request.json
+
+        # التفسير لسجل واحد فقط
+        if not isinstance(data, dict):
+            return jsonify({"error": "Request body must be a single JSON object"}), 400
+
+        user_input_scaled, missing_columns = encode_input(data)
+
+        if missing_columns:
+            return jsonify({"error": f"Missing columns: {missing_columns}"}), 400
 
-        # تحويل الميزات الاسمية باستخدام One-Hot Encoding
-        nominal_columns = ['Race', 'Diabetic', 'GenHealth']
-        one_hot_encoded = one_hot_encoder.transform(user_input[nominal_columns])
-        one_hot_df = pd.DataFrame(one_hot_encoded, columns=one_hot_encoder.get_feature_names_out(nominal_columns))
+        threshold, threshold_error = parse_threshold()
+        if threshold_error:
+            return jsonify({"error": threshold_error}), 400
 
-        # دمج البيانات بعد One-Hot Encoding
-        user_input = pd.concat([user_input.drop(nominal_columns, axis=1), one_hot_df], axis=1)
+        # تحديد حجم الخلفية ضمن الحد المسموح للحفاظ على زمن استجابة ثابت
+        background_size, background_size_error = parse_background_size()
+        if background_size_error:
+            return jsonify({"error": background_size_error}), 400
+        background = get_background()[:background_size]
 
-        # إعادة ترتيب الأعمدة بنفس الترتيب المستخدم أثناء التدريب
-        user_input = user_input.reindex(columns=expected_feature_names, fill_value=0)
+        # جميع العينات المعدلة تمرر للنموذج في استدعاء واحد، بنفس الاحتمالات المعايرة المستخدمة في /predict
+        score, expected_score, attributions = group_ablation_attributions(
+            lambda features: risk_scores(features)[0], user_input_scaled, background, list(feature_groups.values())
+        )
 
-        # تطبيق StandardScaler
-        user_input_scaled = scaler.transform(user_input)
+        result = classify_risk(score, threshold).item()
 
-        # تنفيذ التنبؤ
-        prediction = model.predict(user_input_scaled)
-        result = "High Prediction of heart failure" if prediction[0] == 1 else "Low Prediction of heart failure"
+        # ترتيب الميزات حسب قوة تأثيرها
+        ranked = sorted(zip(feature_groups.keys(), attributions), key=lambda item: abs(item[1]), reverse=True)
 
-        return jsonify({'HeartFailureRisk': result})
+        return jsonify({
+            'HeartFailureRisk': result,
+            'isHighRisk': result == HIGH_RISK_RESULT,
+            'score': float(score),
+            'threshold': threshold,
+            'calibrated': calibrator is not None,
+            'expectedScore': float(expected_score),
+            'backgroundSize': int(len(background)),
+            'attributions': [{'feature': name, 'attribution': float(value)} for name, value in ranked]
+        })
 
     except Exception as e:
-        return jsonify({'error': str(e)})
+        return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
     app.run(debug=True, port=49232, host='127.0.0.1')
@@ -5,14 +5,19 @@ import sys
 from pathlib import Path
 import csv
 import io
+from ecg_preprocessing import MODEL_SAMPLING_RATE
 
-def convert_csv_to_format(input_file, output_file=None):
+# أقصى مدة تسجيل يتم الاحتفاظ بها (40 ثانية = 5000 نقطة بمعدل النموذج)
+MAX_ECG_SECONDS = 40
+
+def convert_csv_to_format(input_file, output_file=None, sampling_rate=None):
     """
     تحويل ملف CSV إلى التنسيق المناسب لنموذج ECG
     
     المعلمات:
     input_file (str): مسار ملف الإدخال
     output_file (str): مسار ملف الإخراج. إذا كان None، سيتم استخدام نفس اسم الملف مع إضافة "_processed"
+    sampling_rate (float): معدل عينات التسجيل بالهرتز. إذا كان None نفترض أنه بمعدل النموذج
     
     العودة:
     str: مسار ملف الإخراج
@@ -124,16 +129,14 @@ def convert_csv_to_format(input_file, output_file=None):
         # التعامل مع القيم الناقصة
         data = np.nan_to_num(data, nan=0.0)
         
-        # إذا كان عدد النقاط قليلاً جداً، نكرر البيانات
-        if len(data) < 100:
-            repeat_count = (100 // len(data)) + 1
-            data = np.tile(data, repeat_count)
-            print(f"البيانات قصيرة جداً، تم تكرارها. الطول الجديد: {len(data)}")
+        # لا يتم تكرار البيانات القصيرة هنا: preprocess_ecg_batch يرفض التسجيلات الأقصر من
+        # MIN_SIGNAL_SECONDS ويكمل الباقي بالأصفار حتى طول النموذج بعد المعالجة
         
-        # اقتطاع أي بيانات زائدة عن 5000 نقطة
-        if len(data) > 5000:
-            data = data[:5000]
-            print(f"تم اقتطاع البيانات إلى 5000 نقطة")
+        # اقتطاع أي بيانات زائدة عن MAX_ECG_SECONDS ثانية حسب معدل العينات
+        max_points = int(MAX_ECG_SECONDS * (sampling_rate or MODEL_SAMPLING_RATE))
+        if len(data) > max_points:
+            data = data[:max_points]
+            print(f"تم اقتطاع البيانات إلى {max_points} نقطة")
         
         # إنشاء DataFrame جديد
         new_df = pd.DataFrame([data])
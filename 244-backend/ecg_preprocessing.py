@@ -0,0 +1,218 @@
+import numpy as np
+from fractions import Fraction
+from scipy import signal as sp_signal
+from scipy.ndimage import median_filter
+import logging
+
+logger = logging.getLogger(__name__)
+
+# معدل العينات الذي تدرب عليه النموذج (MIT-BIH heartbeat dataset: 125 Hz، 187 نقطة لكل نبضة)
+MODEL_SAMPLING_RATE = 125
+MODEL_INPUT_LENGTH = 187
+
+# نطاق معدلات العينات المقبولة لتسجيلات ECG بالهرتز
+MIN_SAMPLING_RATE = 50
+MAX_SAMPLING_RATE = 10000
+
+# أقصر تسجيل مقبول (بالثواني). التسجيلات الأقصر من MODEL_INPUT_LENGTH تُكمل بالأصفار بعد المعالجة
+MIN_SIGNAL_SECONDS = 0.5
+
+# حدود مرشح تمرير النطاق الافتراضية بالهرتز
+BANDPASS_LOW_HZ = 0.5
+BANDPASS_HIGH_HZ = 40.0
+
+# نوافذ مرشح الوسيط المستخدم لإزالة انحراف خط الأساس (بالثواني)
+BASELINE_WINDOWS_SECONDS = (0.2, 0.6)
+
+
+def as_signal_batch(signals, dtype=np.float64):
+    """
+    تحويل الإشارات إلى مصفوفة ثنائية الأبعاد (عدد التسجيلات، عدد النقاط)
+
+    المعلمات:
+    signals (array-like): إشارة واحدة (1-D) أو مجموعة إشارات (2-D) أو مدخلات النموذج (N, T, 1)
+    dtype: نوع البيانات المطلوب. لا يتم النسخ إذا كانت البيانات بالنوع المطلوب مسبقًا
+
+    العودة:
+    np.ndarray: مصفوفة بالشكل (N, T)
+    """
+    signals = np.asarray(signals, dtype=dtype)
+    if signals.ndim == 1:
+        signals = signals[np.newaxis, :]
+    elif signals.ndim == 3 and signals.shape[-1] == 1:
+        signals = signals[..., 0]
+
+    if signals.ndim != 2:
+        raise ValueError(f"Expected 1-D or 2-D ECG data, got shape {signals.shape}")
+    return signals
+
+
+def _filtfilt(sos, signals):
+    """تطبيق المرشح ذهابًا وإيابًا على جميع التسجيلات دفعة واحدة مع الحفاظ على نوع البيانات"""
+    sos = sos.astype(signals.dtype, copy=False)
+    # sosfiltfilt يتطلب أن يكون طول الإشارة أكبر من طول الحشو الافتراضي
+    padlen = min(3 * (2 * len(sos) + 1), signals.shape[-1] - 1)
+    return sp_signal.sosfiltfilt(sos, signals, axis=-1, padlen=padlen)
+
+
+def remove_baseline_wander(signals, sampling_rate, windows=BASELINE_WINDOWS_SECONDS):
+    """
+    إزالة انحراف خط الأساس باستخدام مرشحي وسيط متتاليين
+
+    المعلمات:
+    signals (np.ndarray): مصفوفة بالشكل (N, T)
+    sampling_rate (float): معدل العينات بالهرتز
+    windows (tuple): أطوال نوافذ مرشح الوسيط بالثواني
+
+    العودة:
+    np.ndarray: الإشارات بعد طرح خط الأساس
+    """
+    baseline = signals
+    for seconds in windows:
+        # طول النافذة يجب أن يكون فرديًا
+        size = max(int(seconds * sampling_rate) // 2 * 2 + 1, 1)
+        # النافذة على محور الزمن فقط، لذلك تتم معالجة كل التسجيلات في استدعاء واحد
+        baseline = median_filter(baseline, size=(1, size), mode='nearest')
+    return signals - baseline
+
+
+def bandpass_filter(signals, sampling_rate, low=BANDPASS_LOW_HZ, high=BANDPASS_HIGH_HZ, order=2):
+    """
+    تطبيق مرشح Butterworth لتمرير النطاق بدون إزاحة في الطور
+
+    المعلمات:
+    signals (np.ndarray): مصفوفة بالشكل (N, T)
+    sampling_rate (float): معدل العينات بالهرتز
+    low (float): تردد القطع السفلي بالهرتز
+    high (float): تردد القطع العلوي بالهرتز. يتم تقليصه إلى ما دون تردد نايكويست إذا لزم الأمر
+    order (int): رتبة المرشح
+
+    العودة:
+    np.ndarray: الإشارات بعد الترشيح
+    """
+    nyquist = sampling_rate / 2.0
+    high = min(high, 0.95 * nyquist)
+    sos = sp_signal.butter(order, [low, high], btype='bandpass', fs=sampling_rate, output='sos')
+    return _filtfilt(sos, signals)
+
+
+def resample_signals(signals, sampling_rate, target_rate=MODEL_SAMPLING_RATE):
+    """
+    إعادة أخذ العينات إلى معدل النموذج باستخدام الاستيفاء متعدد الأطوار
+
+    المعلمات:
+    signals (np.ndarray): مصفوفة بالشكل (N, T)
+    sampling_rate (float): معدل العينات الأصلي بالهرتز
+    target_rate (float): معدل العينات المطلوب بالهرتز
+
+    العودة:
+    np.ndarray: مصفوفة بالشكل (N, T * target_rate / sampling_rate)
+    """
+    if sampling_rate == target_rate:
+        return signals
+
+    ratio = Fraction(target_rate / sampling_rate).limit_denominator(1000)
+    resampled = sp_signal.resample_poly(signals, ratio.numerator, ratio.denominator, axis=-1)
+    return resampled.astype(signals.dtype, copy=False)
+
+
+def normalize_signals(signals, stats=None, copy=True):
+    """
+    تطبيع الإشارات (z-score)
+
+    المعلمات:
+    signals (np.ndarray): مصفوفة بالشكل (N, T)
+    stats (tuple): (mean, std) محسوبة مسبقًا من بيانات التدريب. إذا كانت None، يتم تطبيع كل تسجيل بإحصائياته
+    copy (bool): إذا كانت False يتم التطبيع في نفس المصفوفة بدون نسخ
+
+    العودة:
+    np.ndarray: الإشارات بعد التطبيع
+    """
+    if copy:
+        signals = signals.copy()
+
+    if stats is None:
+        mean = signals.mean(axis=-1, keepdims=True)
+        std = signals.std(axis=-1, keepdims=True)
+    else:
+        mean, std = (np.asarray(s, dtype=signals.dtype) for s in stats)
+
+    # تجنب القسمة على صفر في الإشارات الثابتة
+    std = np.where(std == 0, 1, std).astype(signals.dtype, copy=False)
+
+    signals -= mean
+    signals /= std
+    return signals
+
+
+def load_normalization_stats(path):
+    """
+    تحميل إحصائيات التطبيع المحسوبة مسبقًا من ملف npz يحتوي على المفتاحين mean و std
+
+    العودة:
+    tuple: (mean, std)
+    """
+    with np.load(path) as stats:
+        return stats['mean'], stats['std']
+
+
+def pad_signals(signals, length=MODEL_INPUT_LENGTH):
+    """
+    إكمال التسجيلات القصيرة بالأصفار في نهايتها حتى الطول المطلوب (بنفس تنسيق نبضات MIT-BIH)
+
+    العودة:
+    np.ndarray: مصفوفة بالشكل (N, max(T, length))
+    """
+    missing = length - signals.shape[-1]
+    if missing <= 0:
+        return signals
+    return np.pad(signals, ((0, 0), (0, missing)), mode='constant')
+
+
+def preprocess_ecg_batch(signals, sampling_rate=None, target_rate=MODEL_SAMPLING_RATE,
+                         stats=None, apply_filters=True, dtype=np.float64):
+    """
+    معالجة مجموعة من تسجيلات ECG دفعة واحدة قبل التنبؤ
+
+    ترتيب المراحل: إعادة أخذ العينات إلى target_rate أولاً (resample_poly يطبق مرشح منع التشويه)،
+    ثم إزالة خط الأساس ومرشح تمرير النطاق بمعدل النموذج، ثم الإكمال بالأصفار حتى
+    MODEL_INPUT_LENGTH، ثم التطبيع. بهذا الترتيب لا تعتمد كلفة مرشح الوسيط على معدل عينات التسجيل.
+
+    المعلمات:
+    signals (array-like): إشارة واحدة أو مصفوفة بالشكل (N, T) لتسجيلات بنفس الطول
+    sampling_rate (float): معدل عينات التسجيلات. إذا كان None نفترض أنها بمعدل النموذج
+    target_rate (float): معدل العينات الذي تدرب عليه النموذج
+    stats (tuple): (mean, std) محسوبة مسبقًا للتطبيع، أو None للتطبيع لكل تسجيل
+    apply_filters (bool): تطبيق إزالة خط الأساس ومرشح تمرير النطاق
+    dtype: نوع البيانات المستخدم في جميع المراحل. np.float32 يتجنب نسخ float64
+
+    العودة:
+    np.ndarray: مصفوفة بالشكل (N, timesteps, 1) جاهزة للنموذج
+    """
+    signals = as_signal_batch(signals, dtype=dtype)
+    if sampling_rate is None:
+        sampling_rate = target_rate
+    logger.info(f"معالجة {signals.shape[0]} تسجيل بطول {signals.shape[1]} ومعدل عينات {sampling_rate}Hz")
+
+    original_length = signals.shape[-1]
+    signals = resample_signals(signals, sampling_rate, target_rate)
+
+    min_length = int(MIN_SIGNAL_SECONDS * target_rate)
+    if signals.shape[-1] < min_length:
+        raise ValueError(
+            f"ECG signal too short: {signals.shape[-1]} samples at {target_rate}Hz, "
+            f"at least {min_length} ({MIN_SIGNAL_SECONDS}s) required"
+        )
+
+    if apply_filters:
+        signals = remove_baseline_wander(signals, target_rate)
+        signals = bandpass_filter(signals, target_rate)
+
+    signals = pad_signals(signals)
+
+    # المصفوفة هنا نسخة خاصة بنا إلا إذا لم تمر بأي مرحلة سابقة
+    owns_data = apply_filters or sampling_rate != target_rate or original_length < MODEL_INPUT_LENGTH
+    signals = normalize_signals(signals, stats=stats, copy=not owns_data)
+
+    # إضافة بُعد الميزات بدون نسخ (batch_size, timesteps, features)
+    return signals[..., np.newaxis]
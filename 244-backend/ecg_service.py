@@ -8,6 +8,9 @@ import logging
 import tempfile
 import os
 from csv_converter import convert_csv_to_format
+from ecg_preprocessing import (preprocess_ecg_batch, load_normalization_stats, MODEL_SAMPLING_RATE,
+                               MIN_SAMPLING_RATE, MAX_SAMPLING_RATE)
+from explainability import occlusion_saliency
 
 # إعداد التسجيل
 logging.basicConfig(level=logging.INFO)
@@ -26,6 +29,20 @@ except Exception as e:
     # لا نرفع استثناء هنا لتجنب فشل تشغيل التطبيق عند البدء
     model = None
 
+# تحميل إحصائيات التطبيع المحسوبة من بيانات التدريب إن وجدت
+stats_path = Path(__file__).parent / 'ECG model' / 'normalization_stats.npz'
+if stats_path.exists():
+    normalization_stats = load_normalization_stats(stats_path)
+    logger.info(f"تم تحميل إحصائيات التطبيع من: {stats_path}")
+else:
+    # بدون إحصائيات محفوظة يتم تطبيع كل تسجيل بإحصائياته
+    normalization_stats = None
+
+# حدود التفسير لكل طلب: عدد المقاطع يحدد عدد العينات التي تمرر للنموذج
+DEFAULT_EXPLAIN_SEGMENTS = 20
+MAX_EXPLAIN_SEGMENTS = 64
+EXPLAIN_BATCH_SIZE = 64
+
 # تعريف الفئات
 CATEGORIES = [
     'Normal',
@@ -35,27 +52,139 @@ CATEGORIES = [
     'Fusion of Paced and Normal'
 ]
 
-def preprocess_ecg_data(data):
+def preprocess_ecg_data(data, sampling_rate=None):
     """
     معالجة بيانات ECG قبل التنبؤ
+
+    المعلمات:
+    data (array-like): إشارة واحدة أو مصفوفة بالشكل (N, T)
+    sampling_rate (float): معدل عينات التسجيل. إذا تم توفيره يتم ترشيح الإشارة وإعادة أخذ العينات لمعدل النموذج
     """
     try:
-        # تحويل البيانات إلى مصفوفة numpy
-        data = np.array(data)
-        logger.info(f"شكل البيانات قبل إعادة التشكيل: {data.shape}")
-        
-        # إعادة تشكيل البيانات للنموذج (batch_size, timesteps, features)
-        data = data.reshape(1, -1, 1)
-        logger.info(f"شكل البيانات بعد إعادة التشكيل: {data.shape}")
-        
-        # تطبيع البيانات
-        data = (data - np.mean(data)) / np.std(data)
-        
+        logger.info(f"شكل البيانات قبل المعالجة: {np.shape(data)}")
+
+        # الملفات بدون معدل عينات نفترض أنها نبضات مرشحة مسبقًا بمعدل النموذج (مثل MIT-BIH)
+        data = preprocess_ecg_batch(
+            data,
+            sampling_rate=sampling_rate,
+            stats=normalization_stats,
+            apply_filters=sampling_rate is not None,
+            dtype=np.float32
+        )
+        logger.info(f"شكل البيانات بعد المعالجة: {data.shape}")
+
         return data
     except Exception as e:
         logger.error(f"خطأ في معالجة البيانات: {str(e)}")
         raise
 
+def load_ecg_upload():
+    """
+    قراءة ملف ECG ومعدل العينات من الطلب وتجهيزهما للنموذج
+
+    العودة:
+    tuple: (بيانات ECG الأصلية، البيانات بعد المعالجة، معدل العينات أو None، استجابة الخطأ أو None)
+    """
+    # التحقق من وجود الملف
+    if 'file' not in request.files:
+        logger.error("لم يتم توفير أي ملف في الطلب")
+        return None, None, None, (jsonify({'error': 'No file provided'}), 400)
+    
+    file = request.files['file']
+    logger.info(f"تم استلام ملف: {file.filename}, نوع البيانات: {file.content_type}")
+    
+    if file.filename == '':
+        logger.error("تم استلام ملف بدون اسم")
+        return None, None, None, (jsonify({'error': 'Empty filename'}), 400)
+
+    # قراءة معدل العينات الاختياري
+    sampling_rate = request.form.get('sampling_rate')
+    if sampling_rate is not None:
+        try:
+            sampling_rate = float(sampling_rate)
+            # نطاق معقول لتسجيلات ECG (يرفض أيضًا nan و inf)
+            if not MIN_SAMPLING_RATE <= sampling_rate <= MAX_SAMPLING_RATE:
+                raise ValueError
+        except ValueError:
+            logger.error(f"معدل عينات غير صالح: {sampling_rate}")
+            return None, None, None, (jsonify({
+                'error': f'sampling_rate must be a number between {MIN_SAMPLING_RATE} and {MAX_SAMPLING_RATE} Hz'
+            }), 400)
+    
+    # حفظ الملف مؤقتًا
+    temp_dir = tempfile.mkdtemp()
+    temp_path = os.path.join(temp_dir, file.filename)
+    file.save(temp_path)
+    logger.info(f"تم حفظ الملف مؤقتًا في: {temp_path}")
+    
+    # تحويل الملف إلى التنسيق المناسب
+    try:
+        processed_file = convert_csv_to_format(temp_path, sampling_rate=sampling_rate)
+        logger.info(f"تم تحويل الملف إلى: {processed_file}")
+        
+        if not processed_file:
+            logger.error("فشل في تحويل الملف")
+            return None, None, None, (jsonify({'error': 'Failed to convert file format'}), 400)
+    except Exception as e:
+        logger.error(f"خطأ أثناء تحويل الملف: {str(e)}")
+        return None, None, None, (jsonify({'error': f'Error converting file: {str(e)}'}), 400)
+        
+    # قراءة بيانات CSV
+    try:
+        df = pd.read_csv(processed_file)
+        logger.info(f"تم قراءة ملف CSV المعالج بنجاح. شكل البيانات: {df.shape}")
+        
+        if df.empty:
+            logger.error("ملف CSV فارغ")
+            return None, None, None, (jsonify({'error': 'Empty CSV file'}), 400)
+            
+        ecg_data = df.iloc[0].values  # نفترض أن البيانات في الصف الأول
+        logger.info(f"تم استخراج بيانات ECG. طول البيانات: {len(ecg_data)}")
+        
+    except Exception as e:
+        logger.error(f"فشل في قراءة ملف CSV: {str(e)}")
+        return None, None, None, (jsonify({'error': f'Failed to read CSV file: {str(e)}'}), 400)
+    
+    # معالجة البيانات
+    try:
+        processed_data = preprocess_ecg_data(ecg_data, sampling_rate)
+    except Exception as e:
+        logger.error(f"فشل في معالجة البيانات: {str(e)}")
+        return None, None, None, (jsonify({'error': f'Failed to preprocess data: {str(e)}'}), 400)
+
+    return ecg_data, processed_data, sampling_rate, None
+
+def select_prediction(probabilities):
+    """
+    تحديد الفئة المتنبأ بها ونسبة الثقة من احتمالات النموذج لتسجيل واحد
+
+    العودة:
+    tuple: (رقم الفئة، نسبة الثقة، نص النتيجة)
+    """
+    # الحصول على الفئة المتنبأ بها ونسبة الثقة
+    predicted_class_index = np.argmax(probabilities)
+    confidence = float(probabilities[predicted_class_index])
+    predicted_class = CATEGORIES[predicted_class_index]
+    
+    # فحص نسبة الثقة - إذا كانت أقل من 90% فالنتيجة غير طبيعية
+    if confidence < 0.9:
+        logger.info(f"نسبة الثقة منخفضة ({confidence:.2f})، اعتبار النتيجة غير طبيعية")
+        # إذا كانت النتيجة طبيعية، نغيرها إلى غير طبيعية
+        if predicted_class == 'Normal':
+            # اختيار تصنيف غير طبيعي بناءً على أعلى احتمال بعد الطبيعي
+            other_probabilities = probabilities.copy()
+            other_probabilities[0] = 0  # تجاهل التصنيف الطبيعي
+            second_best_index = np.argmax(other_probabilities)
+            predicted_class = CATEGORIES[second_best_index]
+            logger.info(f"تم تغيير النتيجة إلى: {predicted_class}")
+        
+        # إضافة ملاحظة حول انخفاض الثقة
+        prediction_note = f"{predicted_class} (Low confidence)"
+    else:
+        prediction_note = predicted_class
+
+    return CATEGORIES.index(predicted_class), confidence, prediction_note
+
 @ecg_bp.route('/predict-ecg', methods=['POST'])
 @swag_from({
     'tags': ['ECG'],
@@ -67,6 +196,13 @@ def preprocess_ecg_data(data):
             'type': 'file',
             'required': True,
             'description': 'ملف CSV يحتوي على بيانات ECG'
+        },
+        {
+            'name': 'sampling_rate',
+            'in': 'formData',
+            'type': 'number',
+            'required': False,
+            'description': 'معدل عينات التسجيل بالهرتز. إذا تم توفيره يتم ترشيح الإشارة وإعادة أخذ العينات لمعدل النموذج'
         }
     ],
     'responses': {
@@ -95,59 +231,10 @@ def predict_ecg():
             logger.error("النموذج غير محمل. لا يمكن إجراء التنبؤ.")
             return jsonify({'error': 'Model not loaded. Check server logs.'}), 500
             
-        # التحقق من وجود الملف
-        if 'file' not in request.files:
-            logger.error("لم يتم توفير أي ملف في الطلب")
-            return jsonify({'error': 'No file provided'}), 400
-        
-        file = request.files['file']
-        logger.info(f"تم استلام ملف: {file.filename}, نوع البيانات: {file.content_type}")
-        
-        if file.filename == '':
-            logger.error("تم استلام ملف بدون اسم")
-            return jsonify({'error': 'Empty filename'}), 400
-        
-        # حفظ الملف مؤقتًا
-        temp_dir = tempfile.mkdtemp()
-        temp_path = os.path.join(temp_dir, file.filename)
-        file.save(temp_path)
-        logger.info(f"تم حفظ الملف مؤقتًا في: {temp_path}")
-        
-        # تحويل الملف إلى التنسيق المناسب
-        try:
-            processed_file = convert_csv_to_format(temp_path)
-            logger.info(f"تم تحويل الملف إلى: {processed_file}")
-            
-            if not processed_file:
-                logger.error("فشل في تحويل الملف")
-                return jsonify({'error': 'Failed to convert file format'}), 400
-        except Exception as e:
-            logger.error(f"خطأ أثناء تحويل الملف: {str(e)}")
-            return jsonify({'error': f'Error converting file: {str(e)}'}), 400
-            
-        # قراءة بيانات CSV
-        try:
-            df = pd.read_csv(processed_file)
-            logger.info(f"تم قراءة ملف CSV المعالج بنجاح. شكل البيانات: {df.shape}")
-            
-            if df.empty:
-                logger.error("ملف CSV فارغ")
-                return jsonify({'error': 'Empty CSV file'}), 400
-                
-            ecg_data = df.iloc[0].values  # نفترض أن البيانات في الصف الأول
-            logger.info(f"تم استخراج بيانات ECG. طول البيانات: {len(ecg_data)}")
-            
-        except Exception as e:
-            logger.error(f"فشل في قراءة ملف CSV: {str(e)}")
-            return jsonify({'error': f'Failed to read CSV file: {str(e)}'}), 400
-        
-        # معالجة البيانات
-        try:
-            processed_data = preprocess_ecg_data(ecg_data)
-        except Exception as e:
-            logger.error(f"فشل في معالجة البيانات: {str(e)}")
-            return jsonify({'error': f'Failed to preprocess data: {str(e)}'}), 400
-        
+        ecg_data, processed_data, _, error = load_ecg_upload()
+        if error:
+            return error
+
         # التنبؤ
         try:
             logger.info("محاولة تنفيذ التنبؤ")
@@ -157,27 +244,7 @@ def predict_ecg():
             logger.error(f"فشل في تنفيذ التنبؤ: {str(e)}")
             return jsonify({'error': f'Failed to make prediction: {str(e)}'}), 500
         
-        # الحصول على الفئة المتنبأ بها ونسبة الثقة
-        predicted_class_index = np.argmax(predictions[0])
-        confidence = float(predictions[0][predicted_class_index])
-        predicted_class = CATEGORIES[predicted_class_index]
-        
-        # فحص نسبة الثقة - إذا كانت أقل من 90% فالنتيجة غير طبيعية
-        if confidence < 0.9:
-            logger.info(f"نسبة الثقة منخفضة ({confidence:.2f})، اعتبار النتيجة غير طبيعية")
-            # إذا كانت النتيجة طبيعية، نغيرها إلى غير طبيعية
-            if predicted_class == 'Normal':
-                # اختيار تصنيف غير طبيعي بناءً على أعلى احتمال بعد الطبيعي
-                other_probabilities = predictions[0].copy()
-                other_probabilities[0] = 0  # تجاهل التصنيف الطبيعي
-                second_best_index = np.argmax(other_probabilities)
-                predicted_class = CATEGORIES[second_best_index]
-                logger.info(f"تم تغيير النتيجة إلى: {predicted_class}")
-            
-            # إضافة ملاحظة حول انخفاض الثقة
-            prediction_note = f"{predicted_class} (Low confidence)"
-        else:
-            prediction_note = predicted_class
+        _, confidence, prediction_note = select_prediction(predictions[0])
         
         logger.info(f"النتيجة النهائية: {prediction_note}, الثقة: {confidence}")
         
@@ -190,4 +257,113 @@ def predict_ecg():
         
     except Exception as e:
         logger.error(f"خطأ غير متوقع: {str(e)}")
-        return jsonify({'error': str(e)}), 500 
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+@ecg_bp.route('/predict-ecg/explain', methods=['POST'])
+@swag_from({
+    'tags': ['ECG'],
+    'description': 'تفسير تصنيف ECG: أهمية كل مقطع زمني في الإشارة',
+    'parameters': [
+        {
+            'name': 'file',
+            'in': 'formData',
+            'type': 'file',
+            'required': True,
+            'description': 'ملف CSV يحتوي على بيانات ECG'
+        },
+        {
+            'name': 'sampling_rate',
+            'in': 'formData',
+            'type': 'number',
+            'required': False,
+            'description': 'معدل عينات التسجيل بالهرتز'
+        },
+        {
+            'name': 'segments',
+            'in': 'formData',
+            'type': 'integer',
+            'required': False,
+            'description': f'عدد المقاطع الزمنية (الحد الأقصى {MAX_EXPLAIN_SEGMENTS})'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'نتيجة التحليل مع أهمية المقاطع',
+            'schema': {
+                'properties': {
+                    'prediction': {'type': 'string', 'description': 'تصنيف ECG'},
+                    'confidence': {'type': 'number', 'description': 'نسبة الثقة في التنبؤ'},
+                    'segments': {'type': 'array', 'description': 'بداية ونهاية وأهمية كل مقطع', 'items': {'type': 'object'}},
+                    'saliency': {'type': 'array', 'description': 'الأهمية لكل نقطة زمنية', 'items': {'type': 'number'}}
+                }
+            }
+        },
+        400: {
+            'description': 'خطأ في البيانات المدخلة'
+        },
+        500: {
+            'description': 'خطأ في الخادم'
+        }
+    }
+})
+def explain_ecg():
+    try:
+        # التحقق من تحميل النموذج
+        if model is None:
+            logger.error("النموذج غير محمل. لا يمكن إجراء التفسير.")
+            return jsonify({'error': 'Model not loaded. Check server logs.'}), 500
+
+        ecg_data, processed_data, sampling_rate, error = load_ecg_upload()
+        if error:
+            return error
+
+        # تحديد عدد المقاطع ضمن الحد المسموح للحفاظ على زمن استجابة ثابت
+        segments = request.form.get('segments', DEFAULT_EXPLAIN_SEGMENTS)
+        try:
+            segments = int(segments)
+        except ValueError:
+            logger.error(f"عدد مقاطع غير صالح: {segments}")
+            return jsonify({'error': 'segments must be an integer'}), 400
+        segments = max(1, min(segments, MAX_EXPLAIN_SEGMENTS))
+
+        # التنبؤ الأصلي وجميع الإشارات المحجوبة تمرر للنموذج في استدعاء واحد،
+        # ويتم تفسير نفس الفئة التي يعيدها /predict-ecg
+        try:
+            logger.info(f"محاولة تفسير التنبؤ باستخدام {segments} مقطع")
+            explanation = occlusion_saliency(
+                lambda batch: model.predict(batch, batch_size=EXPLAIN_BATCH_SIZE, verbose=0),
+                processed_data,
+                class_selector=lambda probabilities: select_prediction(probabilities)[0],
+                n_segments=segments
+            )
+        except Exception as e:
+            logger.error(f"فشل في تفسير التنبؤ: {str(e)}")
+            return jsonify({'error': f'Failed to explain prediction: {str(e)}'}), 500
+
+        _, confidence, prediction_note = select_prediction(explanation['probabilities'])
+
+        # المقاطع والأهمية محسوبة بمحور زمن الإشارة بعد المعالجة (بمعدل عينات النموذج)،
+        # لذلك يتم تحويلها إلى محور الإشارة الأصلية المعادة في ecgData
+        scale = (sampling_rate or MODEL_SAMPLING_RATE) / MODEL_SAMPLING_RATE
+        bounds = np.minimum(np.rint(explanation['bounds'] * scale).astype(int), len(ecg_data))
+        bounds[-1] = len(ecg_data)
+        saliency = explanation['saliency']
+        raw_positions = np.arange(len(ecg_data)) / scale
+        saliency = np.interp(raw_positions, np.arange(len(saliency)), saliency)
+
+        return jsonify({
+            'prediction': prediction_note,
+            'confidence': confidence,
+            # المقاطع التي تقع بالكامل في الأصفار المضافة للإكمال لا تقابل أي جزء من الإشارة
+            'segments': [
+                {'start': int(bounds[i]), 'end': int(bounds[i + 1]), 'score': float(score)}
+                for i, score in enumerate(explanation['segment_scores'])
+                if bounds[i] < bounds[i + 1]
+            ],
+            'saliency': saliency.tolist(),
+            'ecgData': ecg_data.tolist()
+        })
+
+    except Exception as e:
+        logger.error(f"خطأ غير متوقع: {str(e)}")
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,93 @@
+import numpy as np
+from functools import lru_cache
+
+
+def group_ablation_attributions(predict_fn, x, background, groups):
+    """
+    حساب مساهمة كل مجموعة ميزات في التنبؤ باستبدالها بقيم من بيانات الخلفية
+
+    يتم بناء جميع العينات المعدلة في مصفوفة واحدة وتمريرها للنموذج في استدعاء واحد،
+    لذلك عدد التنفيذات ثابت مهما كان عدد الميزات.
+
+    المعلمات:
+    predict_fn (callable): دالة تستقبل مصفوفة (N, F) وتعيد درجة لكل صف (N,)
+    x (np.ndarray): العينة المراد تفسيرها بالشكل (1, F)
+    background (np.ndarray): بيانات الخلفية بالشكل (K, F)
+    groups (list): قائمة بمؤشرات الأعمدة لكل ميزة أصلية (مثلاً جميع أعمدة One-Hot لنفس الميزة)
+
+    العودة:
+    tuple: (درجة العينة، متوسط درجة الخلفية، مصفوفة المساهمات بطول عدد المجموعات)
+    """
+    x = np.asarray(x, dtype=np.float64).reshape(1, -1)
+    background = np.asarray(background, dtype=np.float64)
+    n_groups, n_background = len(groups), background.shape[0]
+
+    masks = np.zeros((n_groups, x.shape[1]), dtype=bool)
+    for g, columns in enumerate(groups):
+        masks[g, columns] = True
+
+    # (G, K, F): لكل مجموعة ولكل عينة خلفية، نسخة من x مع استبدال أعمدة المجموعة
+    ablated = np.where(masks[:, np.newaxis, :], background[np.newaxis, :, :], x[np.newaxis, :, :])
+    batch = np.concatenate([x, background, ablated.reshape(n_groups * n_background, -1)])
+
+    scores = np.asarray(predict_fn(batch), dtype=np.float64)
+    score = scores[0]
+    expected_score = scores[1:1 + n_background].mean()
+    ablated_scores = scores[1 + n_background:].reshape(n_groups, n_background).mean(axis=1)
+
+    return score, expected_score, score - ablated_scores
+
+
+@lru_cache(maxsize=32)
+def segment_layout(length, n_segments):
+    """
+    تقسيم محور الزمن إلى مقاطع متساوية تقريبًا (يتم تخزين النتيجة مؤقتًا لكل طول)
+
+    العودة:
+    tuple: (حدود المقاطع بطول n_segments + 1، رقم المقطع لكل نقطة زمنية، أقنعة المقاطع (S, T))
+    """
+    n_segments = max(1, min(n_segments, length))
+    bounds = np.linspace(0, length, n_segments + 1).astype(int)
+    segment_ids = np.searchsorted(bounds[1:], np.arange(length), side='right')
+    masks = segment_ids[np.newaxis, :] == np.arange(n_segments)[:, np.newaxis]
+    for array in (bounds, segment_ids, masks):
+        array.flags.writeable = False
+    return bounds, segment_ids, masks
+
+
+def occlusion_saliency(predict_fn, signal, class_selector=None, n_segments=20, fill_value=0.0):
+    """
+    حساب أهمية كل مقطع زمني من إشارة ECG عبر حجبه وقياس انخفاض احتمال الفئة
+
+    المعلمات:
+    predict_fn (callable): دالة تستقبل مصفوفة (N, T, 1) وتعيد الاحتمالات (N, C)
+    signal (np.ndarray): إشارة واحدة بعد المعالجة بالشكل (T,) أو (1, T, 1)
+    class_selector (callable): دالة تستقبل احتمالات الإشارة الأصلية وتعيد رقم الفئة المراد تفسيرها.
+        إذا كانت None يتم استخدام الفئة ذات الاحتمال الأعلى
+    n_segments (int): عدد المقاطع الزمنية (يحدد عدد العينات في الاستدعاء الواحد)
+    fill_value (float): القيمة المستخدمة للحجب. 0 تساوي المتوسط بعد التطبيع
+
+    العودة:
+    dict: الاحتمالات الأصلية، الفئة، حدود المقاطع، أهمية كل مقطع، والأهمية لكل نقطة زمنية
+    """
+    signal = np.asarray(signal).reshape(-1)
+    bounds, segment_ids, masks = segment_layout(signal.shape[0], n_segments)
+
+    occluded = np.where(masks, np.asarray(fill_value, dtype=signal.dtype), signal[np.newaxis, :])
+    batch = np.concatenate([signal[np.newaxis, :], occluded])[..., np.newaxis]
+
+    probabilities = np.asarray(predict_fn(batch))
+    if class_selector is None:
+        class_index = int(np.argmax(probabilities[0]))
+    else:
+        class_index = int(class_selector(probabilities[0]))
+
+    segment_scores = probabilities[0, class_index] - probabilities[1:, class_index]
+
+    return {
+        'probabilities': probabilities[0],
+        'class_index': class_index,
+        'bounds': bounds,
+        'segment_scores': segment_scores,
+        'saliency': segment_scores[segment_ids]
+    }
@@ -0,0 +1,32 @@
+-- Store the numeric risk score and the thresholded decision in typed columns
+alter table public.predictions
+  add column if not exists risk_score double precision check (risk_score between 0 and 1),
+  add column if not exists is_high_risk boolean;
+
+-- Backfill the decision for rows saved before the typed columns existed
+update public.predictions
+set is_high_risk = prediction_result like '%High%'
+where is_high_risk is null;
+
+-- Every row must carry a decision so user_stats counts it as high or low risk
+alter table public.predictions
+  alter column is_high_risk set not null;
+
+-- Create indexes for analytics on the typed columns
+create index if not exists predictions_risk_score_idx on predictions(risk_score);
+create index if not exists predictions_user_id_is_high_risk_idx on predictions(user_id, is_high_risk);
+
+-- Recreate stats view on the boolean column instead of scanning prediction_result text
+create or replace view public.user_stats as
+select
+  user_id,
+  count(*) as total_predictions,
+  count(*) filter (where is_high_risk) as high_risk_predictions,
+  count(*) filter (where not is_high_risk) as low_risk_predictions,
+  max(created_at) as last_prediction_date,
+  avg(risk_score) as average_risk_score
+from public.predictions
+group by user_id;
+
+-- Grant access to authenticated users
+grant select on public.user_stats to authenticated;